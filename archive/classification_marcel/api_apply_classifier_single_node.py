@@ -13,6 +13,9 @@ import os
 import time
 import argparse
 import json
+import multiprocessing
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
 # Assumes that the root of the CameraTraps repo is on the PYTHONPATH
 import ct_utils
@@ -23,6 +26,31 @@ import PIL
 import humanfriendly
 import tqdm
 
+# Optional, faster JPEG decoders (libjpeg-turbo); we fall back to PIL when
+# neither is available, and always use PIL for non-JPEG files
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB
+    turbo_jpeg = TurboJPEG()
+except Exception:
+    turbo_jpeg = None
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+# Optional; used to JIT-compile the crop-box math (see compute_crop_boxes)
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Optional, faster JSON serializer; used when writing the output file
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Minimum detection confidence for classifying an object
 DEFAULT_CONFIDENCE_THRESHOLD = 0.85
 
@@ -45,6 +73,38 @@ assert all([isinstance(x, str) for x in DETECTION_CATEGORY_WHITELIST])
 # Number of significant float digits in JSON output
 NUM_SIGNIFICANT_DIGITS = 3
 
+# Side length (in pixels) of the square crops we pass to the classifier
+#
+# All crops are resized to this size so they can be stacked into a single batch
+CLASSIFIER_INPUT_SIZE = 299
+
+# The exported classifier graphs (see export_inference_graph_serengeti.sh) take
+# a single [None,None,3] image at 'input:0' and run the slim eval preprocessing
+# (central crop, resize, scale to [-1,1]) in-graph before the network.  That
+# subgraph is single-image only, so the batched wrapper in
+# get_classifier_session bypasses it and grafts its crop batch onto the
+# post-preprocessing tensor instead: the top-level expand_dims in
+# export_inference_graph_definition.py, named by the constant below.  The
+# wrapper replicates the bypassed central crop (inception_preprocessing's
+# default central_fraction) and [-1,1] scaling itself.
+CLASSIFIER_NETWORK_INPUT_TENSOR = 'ExpandDims:0'
+CLASSIFIER_CENTRAL_FRACTION = 0.875
+
+# Number of crops to run through the classifier in a single sess.run call
+DEFAULT_BATCH_SIZE = 32
+
+# Maximum fraction of the image area that an image's crop boxes may cover in
+# total for the partial-JPEG-decode path to be used; above this, one full decode
+# is cheaper than decoding overlapping regions box by box.
+JPEG_PARTIAL_DECODE_MAX_COVERAGE = 0.3
+
+# Number of images to load and decode ahead of the one currently being classified.
+#
+# Disk I/O and libjpeg both release the GIL, so a small thread pool hides image-load
+# latency behind GPU inference.  This also bounds the number of decoded images held
+# in memory at once.
+IMAGE_PREFETCH_COUNT = 4
+
 
 #%% Core detection functions
 
@@ -66,6 +126,139 @@ def load_model(checkpoint):
     return graph
 
 
+def build_session_config(enable_xla=False, enable_fp16=False):
+    """
+    Builds the tf.ConfigProto used for classifier sessions.
+
+    With enable_xla, TF's global JIT level is turned on so the fixed-shape
+    classifier batches get XLA-compiled, fusing conv/bias/activation chains and
+    removing intermediate memory roundtrips.  The first few sess.run calls are
+    slower while clusters compile; only worth it for long runs.
+
+    With enable_fp16, grappler's automatic mixed precision rewrite runs the
+    conv/matmul layers in float16 (same effect as setting
+    TF_ENABLE_AUTO_MIXED_PRECISION=1), roughly doubling throughput on GPUs
+    with tensor cores (V100/T4 and later) with negligible accuracy change.
+    No-op on GPUs without float16 support.
+    """
+
+    config = tf.ConfigProto()
+
+    # Grab GPU memory as needed rather than all up front, so the session can
+    # coexist with a detector (or another classifier) on the same GPU
+    config.gpu_options.allow_growth = True
+
+    if enable_xla:
+        config.graph_options.optimizer_options.global_jit_level = tf.OptimizerOptions.ON_1
+    if enable_fp16:
+        config.graph_options.rewrite_options.auto_mixed_precision = 1
+    return config
+
+
+# The session and tensor handles classify_boxes needs, see get_classifier_session
+ClassifierSession = namedtuple('ClassifierSession',
+                               ['sess', 'image', 'boxes', 'crops', 'encoded_jpeg',
+                                'crop_window', 'partial_crop', 'predictions'])
+
+
+def get_classifier_session(classification_graph, enable_xla=False, batch_size=DEFAULT_BATCH_SIZE,
+                           enable_fp16=False):
+    """
+    Returns a ClassifierSession for the given classifier graph, wrapping it
+    with the crop_and_resize prelude used by classify_boxes.  Besides the
+    whole-image cropping path (feed .image and .boxes, fetch .predictions),
+    the wrapper graph carries a partial-decode path (feed .encoded_jpeg and a
+    [y, x, height, width] .crop_window, fetch .partial_crop) that uses
+    decode_and_crop_jpeg so libjpeg only decodes the crop region; the
+    resulting crops can then be fed back in via .crops for classification.
+
+    The exported graphs' own preprocessing (see CLASSIFIER_NETWORK_INPUT_TENSOR)
+    is single-image, so the crop batch is grafted onto the tensor *after* it;
+    the central crop and [-1,1] scaling that subgraph would have applied are
+    replicated here, on the boxes and on the assembled batch respectively.
+    Crops fed in via .crops must therefore be [0,1] crops of the *centrally
+    shrunk* boxes, which is what .partial_crop and prepare_crops produce.
+
+    The wrapper graph and session are built on first use and cached on the
+    graph object, so repeated classify_boxes calls against the same classifier
+    reuse one session instead of paying graph finalization and memory-allocator
+    warmup (easily seconds per call) every time.  enable_xla, batch_size, and
+    enable_fp16 only take effect on the first call for a given graph;
+    batch_size is used for a throwaway warmup run at the batch shape
+    classify_boxes will feed.
+    """
+
+    if hasattr(classification_graph, 'classifier_session'):
+        return classification_graph.classifier_session
+
+    graph_def = classification_graph.as_graph_def()
+
+    # Wrap the classifier with a fused cropping prelude: the whole uint8 image
+    # and its crop boxes go in, and crop_and_resize does cast, [0,1] scaling,
+    # cropping, and bilinear resize to the fixed input size as one graph op
+    wrapper_graph = tf.Graph()
+    with wrapper_graph.as_default():
+
+        image_tensor = tf.placeholder(tf.uint8, [None, None, 3], name='image_u8')
+        boxes_tensor = tf.placeholder(tf.float32, [None, 4], name='crop_boxes')
+
+        # Shrink each box around its center by the central fraction the
+        # bypassed preprocessing would have cropped from the resized crop;
+        # shrinking the box first is equivalent and costs nothing
+        box_centers = (boxes_tensor[:, :2] + boxes_tensor[:, 2:]) * 0.5
+        box_half_sizes = (boxes_tensor[:, 2:] - boxes_tensor[:, :2]) \
+            * (0.5 * CLASSIFIER_CENTRAL_FRACTION)
+        central_boxes = tf.concat([box_centers - box_half_sizes,
+                                   box_centers + box_half_sizes], axis=1)
+
+        image_float = tf.image.convert_image_dtype(image_tensor, tf.float32)
+        crops_tensor = tf.image.crop_and_resize(
+            tf.expand_dims(image_float, 0),
+            central_boxes,
+            box_ind=tf.zeros_like(boxes_tensor[:, 0], dtype=tf.int32),
+            crop_size=[CLASSIFIER_INPUT_SIZE, CLASSIFIER_INPUT_SIZE])
+
+        # Partial-decode path: decode and crop one box directly from the
+        # encoded JPEG (libjpeg decodes only the MCUs covering the crop
+        # window), then central-crop and resize to the classifier input size.
+        # Output is one [1,H,W,3] float32 crop that can be fed back in via
+        # crops_tensor.
+        encoded_jpeg_tensor = tf.placeholder(tf.string, [], name='encoded_jpeg')
+        crop_window_tensor = tf.placeholder(tf.int32, [4], name='crop_window')
+        partial_crop = tf.io.decode_and_crop_jpeg(encoded_jpeg_tensor, crop_window_tensor, channels=3)
+        partial_crop = tf.image.convert_image_dtype(partial_crop, tf.float32)
+        partial_crop = tf.image.central_crop(partial_crop, CLASSIFIER_CENTRAL_FRACTION)
+        partial_crop_tensor = tf.image.resize_bilinear(
+            tf.expand_dims(partial_crop, 0), [CLASSIFIER_INPUT_SIZE, CLASSIFIER_INPUT_SIZE])
+
+        # The [-1,1] scaling the bypassed preprocessing would have applied
+        network_input = tf.multiply(tf.subtract(crops_tensor, 0.5), 2.0)
+
+        # Graft the batch onto the post-preprocessing tensor; 'output:0' is
+        # then [N,num_classes], one row per crop box
+        predictions_tensor, = tf.import_graph_def(graph_def,
+                                                  input_map={CLASSIFIER_NETWORK_INPUT_TENSOR: network_input},
+                                                  return_elements=['output:0'],
+                                                  name='classifier')
+
+    sess = tf.Session(graph=wrapper_graph, config=build_session_config(enable_xla, enable_fp16))
+
+    # One throwaway run at the batch shape classify_boxes will feed, so graph
+    # finalization, allocator growth, and cudnn autotuning all happen here
+    # rather than on the first real image
+    sess.run(predictions_tensor,
+             feed_dict={crops_tensor: np.zeros(
+                 (batch_size, CLASSIFIER_INPUT_SIZE, CLASSIFIER_INPUT_SIZE, 3), dtype=np.float32)})
+
+    classification_graph.classifier_session = ClassifierSession(
+        sess=sess, image=image_tensor, boxes=boxes_tensor, crops=crops_tensor,
+        encoded_jpeg=encoded_jpeg_tensor, crop_window=crop_window_tensor,
+        partial_crop=partial_crop_tensor, predictions=predictions_tensor)
+    return classification_graph.classifier_session
+
+# def get_classifier_session
+
+
 def add_classification_categories(json_object, classes_file):
     """
     Reads the name of classes from the file *classes_file* and adds them to
@@ -102,18 +295,353 @@ def add_classification_categories(json_object, classes_file):
     return json_object
 
 # def add_classification_categories
-    
+
+
+def load_image(image_path):
+    """
+    Loads an image as an HxWx3 uint8 RGB numpy array.
+
+    The image is deliberately *not* normalized here: scaling the full image
+    would allocate an image-sized float buffer per image, while only the
+    cropped boxes ever reach the classifier.  Normalization happens on the
+    crops in classify_boxes.
+
+    JPEG files are decoded with TurboJPEG or cv2 (both backed by libjpeg-turbo,
+    typically 2-4x faster than PIL) when available; everything else goes
+    through PIL.
+
+    Runs on prefetch threads, so it must not touch TF or any other shared state.
+    """
+
+    image_data = None
+
+    if os.path.splitext(image_path)[1].lower() in ('.jpg', '.jpeg'):
+
+        if turbo_jpeg is not None:
+            # TurboJPEG rejects files that aren't actually JPEGs (or are
+            # slightly damaged); fall through to cv2/PIL, which tolerate both
+            try:
+                with open(image_path, 'rb') as f:
+                    image_data = turbo_jpeg.decode(f.read(), pixel_format=TJPF_RGB)
+            except Exception:
+                image_data = None
+
+        if image_data is None and cv2 is not None:
+            # imdecode rather than imread so that non-ascii paths work
+            image_data = cv2.imdecode(np.fromfile(image_path, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if image_data is not None:
+                # BGR --> RGB
+                image_data = image_data[:, :, ::-1]
+
+    if image_data is None:
+        img = PIL.Image.open(image_path)
+        # Ask the decoder for RGB directly, so that convert() below is a no-op
+        # for any JPEGs that end up on this path
+        img.draft('RGB', None)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        # asarray, unlike np.array, doesn't copy the pixel buffer again
+        image_data = np.asarray(img)
+
+    return image_data
+
+# def load_image
+
+
+def load_image_or_jpeg(image_path, bboxes, padding_factor):
+    """
+    Prefetch worker for classify_boxes.  Computes the padded pixel crop boxes
+    for one image and decides how the image should be decoded:
+
+      ('array', image_data, crop_boxes): the fully decoded uint8 image
+      ('jpeg', raw_jpeg, crop_boxes): the undecoded JPEG bytes, for JPEGs whose
+          crop boxes cover at most JPEG_PARTIAL_DECODE_MAX_COVERAGE of the
+          image area, so that decode_and_crop_jpeg can decode just the crop
+          regions instead of the whole image
+
+    crop_boxes is the [N,4] int array of [y0,x0,y1,x1] rectangles for bboxes.
+    For JPEGs the image size comes from the header (PIL doesn't decode pixels
+    until asked), so the 'jpeg' path never runs a full decode at all.
+    """
+
+    if os.path.splitext(image_path)[1].lower() in ('.jpg', '.jpeg'):
+
+        # Reads the header only, no pixel decode
+        with PIL.Image.open(image_path) as img:
+            image_width, image_height = img.size
+            is_jpeg = (img.format == 'JPEG')
+
+        if is_jpeg:
+            crop_boxes = compute_crop_boxes(bboxes, image_height, image_width, padding_factor)
+            crop_areas = ((crop_boxes[:, 2] - crop_boxes[:, 0]).astype(np.int64)
+                          * (crop_boxes[:, 3] - crop_boxes[:, 1]))
+            coverage = float(np.sum(crop_areas)) / (image_height * image_width)
+            if coverage <= JPEG_PARTIAL_DECODE_MAX_COVERAGE:
+                with open(image_path, 'rb') as f:
+                    return ('jpeg', f.read(), crop_boxes)
+
+    image_data = load_image(image_path)
+    image_height, image_width, _ = image_data.shape
+    crop_boxes = compute_crop_boxes(bboxes, image_height, image_width, padding_factor)
+    return ('array', image_data, crop_boxes)
+
+# def load_image_or_jpeg
+
+
+def prepare_crops(job):
+    """
+    Pure-CPU half of the multiprocessing path in classify_boxes: loads and
+    decodes one image, then crops, resizes, and normalizes its qualifying
+    boxes.  Runs in worker processes, so it must not touch TF, and only the
+    (small) resized crops travel back over the pipe, never the full image.
+
+    job is (iJob, image_path, bboxes, padding_factor); returns (iJob, crops)
+    where crops is [N,H,W,3] float32, or (iJob, None) if the image couldn't
+    be loaded.
+    """
+
+    iJob, image_path, bboxes, padding_factor = job
+
+    try:
+        image_data = load_image(image_path)
+        image_height, image_width, _ = image_data.shape
+    except KeyboardInterrupt as e:
+        raise e
+    except:
+        return (iJob, None)
+
+    crop_boxes = compute_crop_boxes(bboxes, image_height, image_width, padding_factor)
+
+    crops = np.empty((len(crop_boxes), CLASSIFIER_INPUT_SIZE, CLASSIFIER_INPUT_SIZE, 3),
+                     dtype=np.float32)
+
+    # cv2.resize writes into this uint8 scratch buffer (dst must match the
+    # source dtype), so the per-box temporaries are limited to one reused
+    # input-sized buffer instead of a fresh output array per resize
+    if cv2 is not None:
+        resize_buffer = np.empty((CLASSIFIER_INPUT_SIZE, CLASSIFIER_INPUT_SIZE, 3),
+                                 dtype=np.uint8)
+
+    for iBox in range(len(crop_boxes)):
+        y0, x0, y1, x1 = crop_boxes[iBox]
+        # Keep only the central fraction of each box, matching the
+        # preprocessing step the wrapper graph bypasses (see
+        # get_classifier_session)
+        margin_y = int((y1 - y0) * (1.0 - CLASSIFIER_CENTRAL_FRACTION) / 2.0)
+        margin_x = int((x1 - x0) * (1.0 - CLASSIFIER_CENTRAL_FRACTION) / 2.0)
+        cropped_img = image_data[y0 + margin_y:y1 - margin_y, x0 + margin_x:x1 - margin_x]
+        if cv2 is not None:
+            cv2.resize(cropped_img, (CLASSIFIER_INPUT_SIZE, CLASSIFIER_INPUT_SIZE),
+                       dst=resize_buffer, interpolation=cv2.INTER_LINEAR)
+            crops[iBox] = resize_buffer
+        else:
+            crops[iBox] = np.array(PIL.Image.fromarray(cropped_img).resize(
+                (CLASSIFIER_INPUT_SIZE, CLASSIFIER_INPUT_SIZE), PIL.Image.BILINEAR))
+
+    # Scale pixel values to [0,1]
+    crops *= (1.0 / 255.0)
+
+    return (iJob, crops)
+
+# def prepare_crops
+
+
+def pad_to_batch_size(batch, batch_size):
+    """
+    Zero-pads [batch] (crops or crop boxes) along axis 0 to exactly
+    [batch_size] rows.  Feeding the classifier the same shape on every
+    sess.run keeps TF's memory planning and cudnn's autotuned kernel choices
+    stable; without this, the final partial batch of every image triggers a
+    re-plan.  Predictions for the padding rows are simply ignored.
+    """
+
+    if len(batch) == batch_size:
+        return batch
+    padded = np.zeros((batch_size,) + batch.shape[1:], dtype=batch.dtype)
+    padded[:len(batch)] = batch
+    return padded
+
+# def pad_to_batch_size
+
+
+def top_classifications(predictions, num_annotated_classes):
+    """
+    Returns the top num_annotated_classes entries of a 1D prediction vector as
+    a list of ['class_index', confidence] pairs, highest confidence first.
+
+    Uses argpartition (O(num_classes)) to pick the top k and only sorts those k
+    entries, rather than argsort'ing the full vector (O(num_classes log num_classes)).
+    """
+
+    if num_annotated_classes < predictions.size:
+        class_indices = np.argpartition(-predictions, num_annotated_classes)[:num_annotated_classes]
+    else:
+        class_indices = np.arange(predictions.size)
+
+    # Sort just the selected entries by descending confidence
+    class_indices = class_indices[np.argsort(-predictions[class_indices])]
+    class_confs = ct_utils.truncate_float_array(predictions[class_indices].tolist())
+
+    return [['%i'%class_idx, class_conf] for class_idx, class_conf in zip(class_indices, class_confs)]
+
+# def top_classifications
+
+
+def compute_crop_box(bbox, image_height, image_width, padding_factor):
+    """
+    Converts one normalized [x_min, y_min, width, height] detection box to an
+    integer pixel crop rectangle (y0, x0, y1, x1), padded to a square enlarged
+    by padding_factor and clipped to the image.
+
+    Plain scalar arithmetic on purpose: this is four floats' worth of math per
+    detection, and the previous NumPy formulation (tile/vstack/hstack on 1x4
+    arrays) spent more time allocating temporaries than computing.
+    """
+
+    ymin = bbox[1] * image_height
+    xmin = bbox[0] * image_width
+    ymax = ymin + bbox[3] * image_height
+    xmax = xmin + bbox[2] * image_width
+
+    # Pad the box to a square whose side is padding_factor times the larger
+    # box dimension
+    box_height = ymax - ymin
+    box_width = xmax - xmin
+    crop_size = padding_factor * max(box_height, box_width)
+    offset_y = (crop_size - box_height) * 0.5
+    offset_x = (crop_size - box_width) * 0.5
+
+    y0 = min(max(int(ymin - offset_y), 0), image_height)
+    x0 = min(max(int(xmin - offset_x), 0), image_width)
+    y1 = min(max(int(ymax + offset_y), 0), image_height)
+    x1 = min(max(int(xmax + offset_x), 0), image_width)
+
+    return y0, x0, y1, x1
+
+# def compute_crop_box
+
+
+def compute_crop_boxes_loop(bboxes, image_height, image_width, padding_factor):
+    """
+    Loop-form kernel behind compute_crop_boxes, same contract; written as plain
+    scalar arithmetic so numba.njit can compile it.  Only called when numba is
+    installed.
+    """
+
+    n = bboxes.shape[0]
+    crop_boxes = np.empty((n, 4), dtype=np.int32)
+
+    for i in range(n):
+        ymin = bboxes[i, 1] * image_height
+        xmin = bboxes[i, 0] * image_width
+        box_height = bboxes[i, 3] * image_height
+        box_width = bboxes[i, 2] * image_width
+        ymax = ymin + box_height
+        xmax = xmin + box_width
+
+        crop_size = padding_factor * max(box_height, box_width)
+        offset_y = (crop_size - box_height) * 0.5
+        offset_x = (crop_size - box_width) * 0.5
+
+        crop_boxes[i, 0] = min(max(int(ymin - offset_y), 0), image_height)
+        crop_boxes[i, 1] = min(max(int(xmin - offset_x), 0), image_width)
+        crop_boxes[i, 2] = min(max(int(ymax + offset_y), 0), image_height)
+        crop_boxes[i, 3] = min(max(int(xmax + offset_x), 0), image_width)
+
+    return crop_boxes
+
+if numba is not None:
+    compute_crop_boxes_loop = numba.njit(cache=True)(compute_crop_boxes_loop)
+
+# def compute_crop_boxes_loop
+
+
+def compute_crop_boxes(bboxes, image_height, image_width, padding_factor):
+    """
+    Vectorized version of compute_crop_box: takes an [N,4] array of normalized
+    [x_min, y_min, width, height] detection boxes and returns an [N,4] int32
+    array of pixel crop rectangles [y0, x0, y1, x1], padded to squares enlarged
+    by padding_factor and clipped to the image.
+
+    With numba installed, the math runs as a JIT-compiled loop with no NumPy
+    dispatch overhead or temporaries; otherwise it falls back to one NumPy pass
+    over all of an image's detections.
+    """
+
+    bboxes = np.atleast_2d(np.asarray(bboxes, dtype=np.float64))
+
+    if numba is not None:
+        return compute_crop_boxes_loop(bboxes, float(image_height), float(image_width),
+                                       float(padding_factor))
+
+    ymin = bboxes[:, 1] * image_height
+    xmin = bboxes[:, 0] * image_width
+    box_height = bboxes[:, 3] * image_height
+    box_width = bboxes[:, 2] * image_width
+    ymax = ymin + box_height
+    xmax = xmin + box_width
+
+    crop_size = padding_factor * np.maximum(box_height, box_width)
+    offset_y = (crop_size - box_height) * 0.5
+    offset_x = (crop_size - box_width) * 0.5
+
+    crop_boxes = np.stack([ymin - offset_y, xmin - offset_x,
+                           ymax + offset_y, xmax + offset_x], axis=1)
+
+    # trunc matches the scalar version's int() conversion
+    crop_boxes = np.trunc(crop_boxes).astype(np.int32)
+    np.clip(crop_boxes[:, 0::2], 0, image_height, out=crop_boxes[:, 0::2])
+    np.clip(crop_boxes[:, 1::2], 0, image_width, out=crop_boxes[:, 1::2])
+
+    return crop_boxes
+
+# def compute_crop_boxes
+
+
+def get_qualifying_detections(image_description, confidence_threshold, detection_category_whitelist):
+    """
+    Returns the detections of one image that should be classified: confident
+    enough, in the category whitelist, and not already classified.
+
+    This only looks at json fields, so callers can run it *before* opening the
+    image and skip the load/decode entirely for images with nothing to
+    classify.  detection_category_whitelist should be a frozenset so that
+    membership tests are O(1).
+    """
+
+    return [d for d in image_description['detections']
+            if d['conf'] >= confidence_threshold
+            and d['category'] in detection_category_whitelist
+            and not d.get('classifications')]
+
+# def get_qualifying_detections
+
 
 def classify_boxes(classification_graph, json_with_classes, image_dir, confidence_threshold=DEFAULT_CONFIDENCE_THRESHOLD,
                   detection_category_whitelist=DETECTION_CATEGORY_WHITELIST, padding_factor=PADDING_FACTOR,
-                  num_annotated_classes=NUM_ANNOTATED_CLASSES):
+                  num_annotated_classes=NUM_ANNOTATED_CLASSES, batch_size=DEFAULT_BATCH_SIZE, enable_xla=False,
+                  num_workers=0, enable_fp16=False):
     """
     Takes a classification model and applies it to all detected boxes with a detection confidence
     larger than confidence_threshold.
 
+    The classifier graph is wrapped with a tf.image.crop_and_resize prelude, so
+    each sess.run takes the whole uint8 image plus up to *batch_size* normalized
+    crop boxes and does cast, [0,1] scaling, cropping, and bilinear resizing to
+    the fixed classifier input size inside the graph.  This keeps every input
+    shape static, avoids Python-side slicing/PIL resizing, and amortizes the
+    per-sess.run overhead across all boxes of an image.
+
+    For JPEGs whose crop boxes cover only a small fraction of the image (see
+    JPEG_PARTIAL_DECODE_MAX_COVERAGE), the image is never fully decoded:
+    decode_and_crop_jpeg extracts just the crop regions from the encoded bytes,
+    so decode cost scales with crop area rather than image area.
+
     Args:
-        classification_graph: frozen graph model that includes the TF-slim preprocessing. i.e. it will be given a cropped
-                              images with values in [0,1]
+        classification_graph: frozen graph model that includes the TF-slim preprocessing, as produced by
+                              export_inference_graph_serengeti.sh: one [None,None,3] image in [0,1] at 'input:0',
+                              predictions at 'output:0'.  The batched wrapper grafts its crops past the
+                              single-image preprocessing subgraph, see get_classifier_session.
         json_with_classes:    Object created from the json file that is generated by the detection API. However, the
                               field 'classification_categories' is already added. The script assumes 0-based indexing.
         image_dir:            Base directory of the images. All paths in the JSON are relative to this folder
@@ -122,6 +650,11 @@ def classify_boxes(classification_graph, json_with_classes, image_dir, confidenc
         padding_factor:       The function will enlarge the bounding boxes by this factor before passing them to the
                               classifier.
         num_annotated_classes: Number of top-scoring class predictions to store in the json
+        batch_size:           Number of crops to classify with a single sess.run call
+        enable_xla:           Compile the classifier with XLA (see build_session_config)
+        num_workers:          If larger than zero, decode/crop/resize runs on this many worker
+                              processes (see prepare_crops) instead of prefetch threads
+        enable_fp16:          Run the classifier in mixed fp16/fp32 precision (see build_session_config)
 
     Returns the updated json object. Classification results are added as field 'classifications' to all elements images/detections
     assuming a 0-based indexing of the classifier output, i.e. output with index 0 has the class key '0'
@@ -132,112 +665,566 @@ def classify_boxes(classification_graph, json_with_classes, image_dir, confidenc
     assert isinstance(detection_category_whitelist, list)
     assert all([isinstance(x, str) for x in detection_category_whitelist])
 
-    with classification_graph.as_default():
+    # The wrapper graph and its session are created once per classifier graph
+    # and reused across calls, so repeated invocations (e.g. one per batch of
+    # json files) don't pay session setup and allocator warmup every time
+    classifier = get_classifier_session(classification_graph, enable_xla, batch_size, enable_fp16)
+    sess = classifier.sess
 
-        with tf.Session(graph=classification_graph) as sess:
+    # Pre-filter detections on the cheap json fields, so that images
+    # with nothing to classify are never opened or decoded at all
+    whitelist = frozenset(detection_category_whitelist)
+    image_jobs = []
+    for image_description in json_with_classes['images']:
+        qualifying = get_qualifying_detections(image_description, confidence_threshold, whitelist)
+        if len(qualifying) == 0:
+            continue
+        image_path = image_description['file']
+        if image_dir:
+            image_path = os.path.join(image_dir, image_path)
+        image_jobs.append((image_path, qualifying, [d['bbox'] for d in qualifying]))
 
-            # Get input and output tensors of classification model
-            image_tensor = classification_graph.get_tensor_by_name('input:0')
-            predictions_tensor = classification_graph.get_tensor_by_name('output:0')
-            predictions_tensor = tf.squeeze(predictions_tensor, [0])
+    nImages = len(image_jobs)
 
-            # For each image
-            nImages = len(json_with_classes['images'])
-            for iImage in tqdm.tqdm(list(range(0,nImages))):
+    # Parallel-CPU path: a process pool handles decode/crop/resize for whole
+    # images (near-linear in physical cores) while this thread keeps the GPU
+    # fed with sess.run.  Preprocessing here is all-Python, so the in-graph
+    # cropping and partial-decode tricks of the default path don't apply.
+    if num_workers > 0:
 
-                image_description = json_with_classes['images'][iImage]
+        jobs = [(iJob, image_jobs[iJob][0], image_jobs[iJob][2], padding_factor)
+                for iJob in range(nImages)]
 
-                # Read image
-                try:
-                    image_path = image_description['file']
-                    if image_dir:
-                        image_path = os.path.join(image_dir, image_path)
-                    image_data = np.array(PIL.Image.open(image_path).convert("RGB"))
-                    # Scale pixel values to [0,1]
-                    image_data = image_data / 255
-                    image_height, image_width, _ = image_data.shape
-                except KeyboardInterrupt as e:
-                    raise e
-                except:
-                    print('Couldn\'t load image {}'.format(image_path))
+        pool = multiprocessing.Pool(processes=num_workers)
+        try:
+
+            # imap_unordered lets fast images overtake slow ones; each result
+            # carries its job index, so detections are matched back up
+            for iJob, crops in tqdm.tqdm(pool.imap_unordered(prepare_crops, jobs, chunksize=8),
+                                         total=nImages):
+
+                if crops is None:
+                    print('Couldn\'t load image {}'.format(image_jobs[iJob][0]))
                     continue
 
-                # For each box
-                nDetections = len(image_description['detections'])
-                for iBox in range(nDetections):
+                qualifying_detections = image_jobs[iJob][1]
 
-                    cur_detection = image_description['detections'][iBox]
+                for iChunk in range(0, len(qualifying_detections), batch_size):
 
-                    # Skip detections with low confidence
-                    if cur_detection['conf'] < confidence_threshold:
-                        continue
+                    chunk_detections = qualifying_detections[iChunk:iChunk + batch_size]
+                    predictions = sess.run(classifier.predictions,
+                                           feed_dict={classifier.crops: pad_to_batch_size(
+                                               crops[iChunk:iChunk + batch_size], batch_size)})
 
-                    # Skip if detection category is not in whitelist
-                    if not cur_detection['category'] in detection_category_whitelist:
-                        continue
+                    for iRow in range(len(chunk_detections)):
+                        chunk_detections[iRow]['classifications'] = \
+                            top_classifications(predictions[iRow], num_annotated_classes)
+
+            # ...for each preprocessed image
+
+        finally:
+            pool.close()
+            pool.join()
+
+        return json_with_classes
+
+    # ...if num_workers > 0
+
+    with ThreadPoolExecutor(max_workers=IMAGE_PREFETCH_COUNT) as executor:
+
+        # Start loading the first few images; the deque acts as a bounded
+        # queue, so at most IMAGE_PREFETCH_COUNT decoded images are in
+        # flight at any time.
+        image_futures = deque()
+
+        def submit_job(iJob):
+            image_futures.append(executor.submit(load_image_or_jpeg, image_jobs[iJob][0],
+                                                 image_jobs[iJob][2], padding_factor))
+
+        for iPrefetch in range(min(IMAGE_PREFETCH_COUNT, nImages)):
+            submit_job(iPrefetch)
+
+        # For each image with at least one qualifying detection
+        for iImage in tqdm.tqdm(list(range(0,nImages))):
+
+            image_path, qualifying_detections, bboxes = image_jobs[iImage]
+
+            # Keep the prefetch window full before blocking on the current image
+            iNextImage = iImage + IMAGE_PREFETCH_COUNT
+            if iNextImage < nImages:
+                submit_job(iNextImage)
+
+            # Read image (load, decode, and crop-box math started on a prefetch thread)
+            try:
+                decode_kind, decoded, crop_boxes = image_futures.popleft().result()
+            except KeyboardInterrupt as e:
+                raise e
+            except:
+                print('Couldn\'t load image {}'.format(image_path))
+                continue
+
+            if decode_kind == 'jpeg':
+
+                # Sparse boxes on a big JPEG: decode only the crop regions from
+                # the encoded bytes, then feed the stacked crops back in for
+                # classification.  Only the header was checked when the bytes
+                # were read, so a truncated or otherwise undecodable file
+                # surfaces here as an OpError; fall back to a full decode,
+                # which tolerates files that decode_and_crop_jpeg rejects.
+                try:
+
+                    for iChunk in range(0, len(qualifying_detections), batch_size):
 
-                    # Skip if already classified
-                    if 'classifications' in cur_detection.keys() and len(cur_detection['classifications']) > 0:
+                        chunk_detections = qualifying_detections[iChunk:iChunk + batch_size]
+                        chunk_crops = []
+                        for y0, x0, y1, x1 in crop_boxes[iChunk:iChunk + batch_size]:
+                            chunk_crops.append(sess.run(classifier.partial_crop,
+                                                        feed_dict={classifier.encoded_jpeg: decoded,
+                                                                   classifier.crop_window: [y0, x0, y1 - y0, x1 - x0]}))
+
+                        predictions = sess.run(classifier.predictions,
+                                               feed_dict={classifier.crops: pad_to_batch_size(
+                                                   np.concatenate(chunk_crops), batch_size)})
+
+                        for iRow in range(len(chunk_detections)):
+                            chunk_detections[iRow]['classifications'] = \
+                                top_classifications(predictions[iRow], num_annotated_classes)
+
+                    # ...for each chunk of boxes
+
+                    continue
+
+                except tf.errors.OpError:
+
+                    # Recompute the crop boxes from the decoded size, in case
+                    # it doesn't match what the header promised
+                    try:
+                        decoded = load_image(image_path)
+                        crop_boxes = compute_crop_boxes(bboxes, decoded.shape[0], decoded.shape[1],
+                                                        padding_factor)
+                    except KeyboardInterrupt as e:
+                        raise e
+                    except:
+                        print('Couldn\'t load image {}'.format(image_path))
                         continue
 
-                    # Get current box in relative coordinates and format [x_min, y_min, width_of_box, height_of_box]
-                    box_orig = cur_detection['bbox']
-                    
-                    # Convert to [ymin, xmin, ymax, xmax] and store it as 1x4 numpy array so we can
-                    # re-use the generic multi-box padding code
-                    box_coords = np.array([[box_orig[1],
-                                            box_orig[0],
-                                            box_orig[1]+box_orig[3],
-                                            box_orig[0]+box_orig[2]
-                                          ]])
-                    # Convert normalized coordinates to pixel coordinates
-                    box_coords_abs = (box_coords * np.tile([image_height, image_width], (1,2)))
-                    
-                    # Pad the detected animal to a square box and additionally by PADDING_FACTOR, the result will be in crop_boxes.
-                    #
-                    # However, we need to make sure that it box coordinates are still within the image.
-                    bbox_sizes = np.vstack([box_coords_abs[:,2] - box_coords_abs[:,0], box_coords_abs[:,3] - box_coords_abs[:,1]]).T
-                    offsets = (padding_factor * np.max(bbox_sizes, axis=1, keepdims=True) - bbox_sizes) / 2
-                    crop_boxes = box_coords_abs + np.hstack([-offsets,offsets])
-                    crop_boxes = np.maximum(0,crop_boxes).astype(int)
-                    
-                    # Get the first (and only) row as our bbox to classify
-                    crop_box = crop_boxes[0]
-
-                    # Get the image data for that box
-                    cropped_img = image_data[crop_box[0]:crop_box[2], crop_box[1]:crop_box[3]]
-                    
-                    # Run inference
-                    predictions = sess.run(predictions_tensor, feed_dict={image_tensor: cropped_img})
-
-                    # Add an empty list to the json for our predictions
-                    cur_detection['classifications'] = list()
-                    
-                    # Add the *num_annotated_classes* top scoring classes
-                    for class_idx in np.argsort(-predictions)[:num_annotated_classes]:
-                        class_conf = ct_utils.truncate_float(predictions[class_idx].item())
-                        cur_detection['classifications'].append(['%i'%class_idx, class_conf])
-
-                # ...for each box
-
-            # ...for each image
+                # ...try partial decode
 
-        # ...with tf.Session
+            image_data = decoded
+            image_height, image_width, _ = image_data.shape
+
+            # Convert the precomputed pixel crop boxes to the normalized
+            # [ymin, xmin, ymax, xmax] format that crop_and_resize expects
+            # (1.0 maps to the last row/column); the pixel rows covered by a
+            # slice [y0:y1] run from y0 to y1-1, so y1-1 is the last sample
+            image_crop_boxes = ((crop_boxes - np.array([0., 0., 1., 1.]))
+                                / np.array([image_height - 1.0, image_width - 1.0,
+                                            image_height - 1.0, image_width - 1.0])).astype(np.float32)
 
-    # with classification_graph
+            # Classify this image's boxes, at most batch_size crops per sess.run
+            for iChunk in range(0, len(qualifying_detections), batch_size):
+
+                chunk_detections = qualifying_detections[iChunk:iChunk + batch_size]
+
+                # Padding the box list (rather than the crops) is enough to
+                # keep the classifier's input at a constant [batch_size,H,W,3]
+                chunk_boxes = pad_to_batch_size(image_crop_boxes[iChunk:iChunk + batch_size],
+                                                batch_size)
+
+                predictions = sess.run(classifier.predictions,
+                                       feed_dict={classifier.image: image_data,
+                                                  classifier.boxes: chunk_boxes})
+
+                for iRow in range(len(chunk_detections)):
+                    chunk_detections[iRow]['classifications'] = \
+                        top_classifications(predictions[iRow], num_annotated_classes)
+
+            # ...for each chunk of boxes
+
+        # ...for each image
+
+    # ...with ThreadPoolExecutor
 
     return json_with_classes
 
 # def classify_boxes
-    
+
+
+def classify_boxes_tf_data(classification_graph, json_with_classes, image_dir, confidence_threshold=DEFAULT_CONFIDENCE_THRESHOLD,
+                           detection_category_whitelist=DETECTION_CATEGORY_WHITELIST, padding_factor=PADDING_FACTOR,
+                           num_annotated_classes=NUM_ANNOTATED_CLASSES, batch_size=DEFAULT_BATCH_SIZE, enable_xla=False,
+                           enable_fp16=False):
+    """
+    Same contract as classify_boxes, but feeds the classifier through a tf.data
+    input pipeline instead of a Python loop with feed_dict.  JPEG decode, crop,
+    and resize run as graph ops with num_parallel_calls=AUTOTUNE, overlapped with
+    GPU inference via batch+prefetch, so the GPU no longer stalls on synchronous
+    per-image preprocessing.
+
+    Restrictions compared to classify_boxes: all images must be readable JPEG
+    files (tf.io.decode_jpeg does the decoding), and a single unreadable file
+    aborts the whole run rather than being skipped with a warning.  Use
+    classify_boxes when that robustness matters more than throughput.
+    """
+
+    # Make sure we have the right json object
+    assert 'classification_categories' in json_with_classes.keys()
+    assert isinstance(detection_category_whitelist, list)
+    assert all([isinstance(x, str) for x in detection_category_whitelist])
+
+    # Pass 1: collect one (path, bbox) entry per qualifying detection.  The bbox
+    # stays in the json's normalized [x_min, y_min, width, height] format; the
+    # padding/cropping math runs inside the pipeline, where the image size is known.
+    whitelist = frozenset(detection_category_whitelist)
+    crop_paths = []
+    crop_bboxes = []
+    crop_detections = []
+
+    for image_description in json_with_classes['images']:
+
+        qualifying = get_qualifying_detections(image_description, confidence_threshold, whitelist)
+        if len(qualifying) == 0:
+            continue
+
+        image_path = image_description['file']
+        if image_dir:
+            image_path = os.path.join(image_dir, image_path)
+
+        for cur_detection in qualifying:
+
+            crop_paths.append(image_path)
+            crop_bboxes.append(cur_detection['bbox'])
+            crop_detections.append(cur_detection)
+
+        # ...for each box
+
+    # ...for each image
+
+    if len(crop_detections) == 0:
+        return json_with_classes
+
+    graph_def = classification_graph.as_graph_def()
+
+    pipeline_graph = tf.Graph()
+    with pipeline_graph.as_default():
+
+        def parse_and_crop(path, bbox):
+            """
+            Reads and decodes one JPEG, then crops out one padded square box and
+            resizes it to the classifier input size, all as graph ops.
+            """
+            raw = tf.io.read_file(path)
+            image = tf.image.decode_jpeg(raw, channels=3)
+            image = tf.image.convert_image_dtype(image, tf.float32)
+
+            image_shape = tf.cast(tf.shape(image), tf.float32)
+            image_height = image_shape[0]
+            image_width = image_shape[1]
+
+            # Convert the normalized [x_min, y_min, width, height] box to pixel
+            # coordinates, then pad to a square box enlarged by padding_factor,
+            # clipped to the image (same math as classify_boxes)
+            ymin = bbox[1] * image_height
+            xmin = bbox[0] * image_width
+            ymax = ymin + bbox[3] * image_height
+            xmax = xmin + bbox[2] * image_width
+            box_height = ymax - ymin
+            box_width = xmax - xmin
+            crop_size = padding_factor * tf.maximum(box_height, box_width)
+            offset_y = (crop_size - box_height) / 2.
+            offset_x = (crop_size - box_width) / 2.
+            y0 = tf.maximum(ymin - offset_y, 0.)
+            x0 = tf.maximum(xmin - offset_x, 0.)
+            y1 = tf.minimum(ymax + offset_y, image_height - 1.)
+            x1 = tf.minimum(xmax + offset_x, image_width - 1.)
+
+            # Keep only the central fraction of the box, matching the
+            # preprocessing step the grafted classifier skips (see
+            # get_classifier_session)
+            margin_y = (y1 - y0) * ((1. - CLASSIFIER_CENTRAL_FRACTION) / 2.)
+            margin_x = (x1 - x0) * ((1. - CLASSIFIER_CENTRAL_FRACTION) / 2.)
+            y0 += margin_y
+            x0 += margin_x
+            y1 -= margin_y
+            x1 -= margin_x
+
+            # crop_and_resize wants normalized [ymin, xmin, ymax, xmax], where
+            # 1.0 maps to the last row/column
+            boxes = tf.stack([y0 / (image_height - 1.), x0 / (image_width - 1.),
+                              y1 / (image_height - 1.), x1 / (image_width - 1.)])
+            crop = tf.image.crop_and_resize(tf.expand_dims(image, 0),
+                                            tf.expand_dims(boxes, 0),
+                                            box_ind=tf.constant([0], dtype=tf.int32),
+                                            crop_size=[CLASSIFIER_INPUT_SIZE, CLASSIFIER_INPUT_SIZE])
+            return tf.squeeze(crop, [0])
+
+        dataset = tf.data.Dataset.from_tensor_slices(
+            (tf.constant(crop_paths), tf.constant(crop_bboxes, dtype=tf.float32)))
+        dataset = dataset.map(parse_and_crop, num_parallel_calls=tf.data.experimental.AUTOTUNE)
+        dataset = dataset.batch(batch_size)
+        dataset = dataset.prefetch(tf.data.experimental.AUTOTUNE)
+        crops_batch = dataset.make_one_shot_iterator().get_next()
+
+        # The [-1,1] scaling the bypassed preprocessing would have applied
+        network_input = tf.multiply(tf.subtract(crops_batch, 0.5), 2.0)
+
+        # Graft the classifier's post-preprocessing input onto the pipeline
+        # output so no feed_dict is needed (see get_classifier_session for why
+        # 'input:0' itself can't take a batch)
+        predictions_tensor, = tf.import_graph_def(graph_def,
+                                                  input_map={CLASSIFIER_NETWORK_INPUT_TENSOR: network_input},
+                                                  return_elements=['output:0'],
+                                                  name='classifier')
+
+        with tf.Session(graph=pipeline_graph, config=build_session_config(enable_xla, enable_fp16)) as sess:
+
+            iDetection = 0
+            with tqdm.tqdm(total=len(crop_detections)) as progress_bar:
+
+                while True:
+
+                    try:
+                        predictions = sess.run(predictions_tensor)
+                    except tf.errors.OutOfRangeError:
+                        break
+
+                    # Batches come back in dataset order, so scatter rows sequentially
+                    for iRow in range(predictions.shape[0]):
+                        crop_detections[iDetection]['classifications'] = \
+                            top_classifications(predictions[iRow], num_annotated_classes)
+                        iDetection += 1
+
+                    progress_bar.update(predictions.shape[0])
+
+                # ...while there are batches left
+
+            assert iDetection == len(crop_detections)
+
+        # ...with tf.Session
+
+    # with pipeline_graph
+
+    return json_with_classes
+
+# def classify_boxes_tf_data
+
+
+def convert_classifier_to_tflite(classifier_file, tflite_file, calibration_image_paths=None):
+    """
+    One-time offline conversion of the frozen classifier graph to a quantized
+    TFLite model.  Post-training INT8 quantization typically gives 2-4x
+    throughput at ~1% accuracy cost; pass the resulting .tflite file as
+    classifier_file to run with it.
+
+    Args:
+        classifier_file: the frozen .pb classifier graph (see classify_boxes for
+                         the expected input/output signature)
+        tflite_file:     output path for the converted model
+        calibration_image_paths: list of representative image files used to
+                         calibrate activation ranges.  Without calibration
+                         images only the weights are quantized, which is less
+                         effective but needs no data.
+    """
+
+    # The exported graphs take one [None,None,3] image at 'input:0' (the
+    # in-graph preprocessing is single-image, see CLASSIFIER_NETWORK_INPUT_TENSOR);
+    # TFLite needs static shapes, so the input is pinned to one
+    # classifier-sized crop at the placeholder's own rank
+    converter = tf.lite.TFLiteConverter.from_frozen_graph(
+        classifier_file,
+        input_arrays=['input'],
+        output_arrays=['output'],
+        input_shapes={'input': [CLASSIFIER_INPUT_SIZE, CLASSIFIER_INPUT_SIZE, 3]})
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    if calibration_image_paths:
+
+        def representative_dataset():
+            for image_path in calibration_image_paths:
+                try:
+                    image_data = load_image(image_path)
+                except Exception:
+                    continue
+                crop = PIL.Image.fromarray(image_data).resize(
+                    (CLASSIFIER_INPUT_SIZE, CLASSIFIER_INPUT_SIZE), PIL.Image.BILINEAR)
+                crop = np.array(crop, dtype=np.float32) * (1.0 / 255.0)
+                yield [crop]
+
+        converter.representative_dataset = representative_dataset
+
+    tflite_model = converter.convert()
+    with open(tflite_file, 'wb') as f:
+        f.write(tflite_model)
+
+    print('Wrote quantized classifier to {}'.format(tflite_file))
+
+# def convert_classifier_to_tflite
+
+
+def convert_classifier_to_trt_fp16(classifier_file, trt_file):
+    """
+    One-time offline conversion of the frozen classifier graph to a TF-TRT
+    graph running in FP16.  On GPUs with tensor cores (V100/T4 and later)
+    this roughly doubles inference throughput with negligible accuracy
+    change; the resulting .pb can be passed as classifier_file like any
+    other frozen graph.  Requires TensorRT, which our environment files
+    don't install; without it, --enable_fp16 (grappler automatic mixed
+    precision, no extra dependency) gets most of the same win.
+
+    Args:
+        classifier_file: the frozen .pb classifier graph (see classify_boxes
+                         for the expected input/output signature)
+        trt_file:        output path for the converted graph
+    """
+
+    # TensorRT bindings are only present in GPU builds with TensorRT installed
+    from tensorflow.python.compiler.tensorrt import trt_convert as trt
+
+    graph_def = tf.GraphDef()
+    with tf.gfile.GFile(classifier_file, 'rb') as fid:
+        graph_def.ParseFromString(fid.read())
+
+    converter = trt.TrtGraphConverter(input_graph_def=graph_def,
+                                      nodes_blacklist=['output'],
+                                      precision_mode='FP16',
+                                      is_dynamic_op=True)
+    trt_graph_def = converter.convert()
+
+    with tf.gfile.GFile(trt_file, 'wb') as fid:
+        fid.write(trt_graph_def.SerializeToString())
+
+    print('Wrote FP16 TF-TRT classifier to {}'.format(trt_file))
+
+# def convert_classifier_to_trt_fp16
+
+
+def classify_boxes_tflite(tflite_file, json_with_classes, image_dir, confidence_threshold=DEFAULT_CONFIDENCE_THRESHOLD,
+                          detection_category_whitelist=DETECTION_CATEGORY_WHITELIST, padding_factor=PADDING_FACTOR,
+                          num_annotated_classes=NUM_ANNOTATED_CLASSES):
+    """
+    Same contract as classify_boxes, but runs a quantized TFLite classifier
+    (see convert_classifier_to_tflite) via tf.lite.Interpreter instead of a
+    frozen TF graph.  Cropping and resizing happen on the CPU here, since the
+    interpreter has no graph to graft a cropping prelude onto.
+
+    The converted model keeps the exported graphs' single-image signature
+    (one [H,W,3] crop in, one prediction row out), so crops run through the
+    interpreter one at a time; the model's own baked-in preprocessing applies
+    the central crop and input scaling.
+    """
+
+    # Make sure we have the right json object
+    assert 'classification_categories' in json_with_classes.keys()
+    assert isinstance(detection_category_whitelist, list)
+    assert all([isinstance(x, str) for x in detection_category_whitelist])
+
+    interpreter = tf.lite.Interpreter(model_path=tflite_file)
+    interpreter.allocate_tensors()
+    input_index = interpreter.get_input_details()[0]['index']
+    output_index = interpreter.get_output_details()[0]['index']
+
+    whitelist = frozenset(detection_category_whitelist)
+
+    # For each image
+    for image_description in tqdm.tqdm(json_with_classes['images']):
+
+        # Filter on the cheap json fields before decoding anything
+        qualifying = get_qualifying_detections(image_description, confidence_threshold, whitelist)
+        if len(qualifying) == 0:
+            continue
+
+        image_path = image_description['file']
+        if image_dir:
+            image_path = os.path.join(image_dir, image_path)
+
+        # Read image
+        try:
+            image_data = load_image(image_path)
+            image_height, image_width, _ = image_data.shape
+        except KeyboardInterrupt as e:
+            raise e
+        except:
+            print('Couldn\'t load image {}'.format(image_path))
+            continue
+
+        # For each box
+        for cur_detection in qualifying:
+
+            y0, x0, y1, x1 = compute_crop_box(cur_detection['bbox'], image_height, image_width,
+                                              padding_factor)
+            crop_resized = PIL.Image.fromarray(image_data[y0:y1, x0:x1]).resize(
+                (CLASSIFIER_INPUT_SIZE, CLASSIFIER_INPUT_SIZE), PIL.Image.BILINEAR)
+            crop_float = np.array(crop_resized, dtype=np.float32)
+            crop_float *= (1.0 / 255.0)
+
+            interpreter.set_tensor(input_index, crop_float)
+            interpreter.invoke()
+            predictions = interpreter.get_tensor(output_index)
+
+            cur_detection['classifications'] = \
+                top_classifications(predictions[0], num_annotated_classes)
+
+        # ...for each box
+
+    # ...for each image
+
+    return json_with_classes
+
+# def classify_boxes_tflite
+
+
+def write_output_json(output_json, output_json_file):
+    """
+    Writes [output_json] (a detector-format dict) to [output_json_file].
+
+    The 'images' list typically dwarfs everything else in the file, so rather
+    than serializing the whole dict in one json.dump call we write the images
+    one at a time; this keeps the peak serialization buffer at one image's
+    worth of text, and compact (un-indented) output is considerably faster to
+    produce than indented output.  Uses orjson for the per-image fragments
+    when it's available.
+    """
+    if orjson is not None:
+        dumps = lambda obj: orjson.dumps(obj).decode('utf-8')
+    else:
+        dumps = lambda obj: json.dumps(obj, separators=(',', ':'))
+
+    with open(output_json_file, 'wt') as fi:
+        fi.write('{')
+        first_field = True
+        for field_name in output_json:
+            if not first_field:
+                fi.write(',')
+            first_field = False
+            fi.write(json.dumps(field_name) + ':')
+            if field_name == 'images':
+                fi.write('[')
+                for iImage, image in enumerate(output_json['images']):
+                    if iImage > 0:
+                        fi.write(',\n')
+                    fi.write(dumps(image))
+                # ...for each image
+                fi.write(']')
+            else:
+                fi.write(dumps(output_json[field_name]))
+        # ...for each top-level field
+        fi.write('}')
+
+# def write_output_json
+
 
 def load_and_run_classifier(classifier_file, classes_file, image_dir, detector_json_file, output_json_file,
                           confidence_threshold=DEFAULT_CONFIDENCE_THRESHOLD, padding_factor=PADDING_FACTOR,
                           num_annotated_classes=NUM_ANNOTATED_CLASSES, detection_category_whitelist=DETECTION_CATEGORY_WHITELIST,
-                          detection_graph=None, classification_graph=None):
+                          batch_size=DEFAULT_BATCH_SIZE, use_tf_data=False, enable_xla=False, num_workers=0,
+                          enable_fp16=False, detection_graph=None, classification_graph=None):
+
+    # A .tflite classifier (see convert_classifier_to_tflite) runs through the
+    # TFLite interpreter rather than a frozen graph
+    use_tflite = classifier_file.lower().endswith('.tflite')
 
     # Load classification model
-    if classification_graph is None:
+    if classification_graph is None and not use_tflite:
         classification_graph = load_model(classifier_file)
 
     # Load detector json
@@ -249,14 +1236,21 @@ def load_and_run_classifier(classifier_file, classes_file, image_dir, detector_j
 
     # Run classifier on all images, changes will be writting directly to the json
     startTime = time.time()
-    updated_json = classify_boxes(classification_graph, updated_json, image_dir, confidence_threshold, detection_category_whitelist,
-                                  padding_factor, num_annotated_classes)
+    if use_tflite:
+        updated_json = classify_boxes_tflite(classifier_file, updated_json, image_dir, confidence_threshold,
+                                             detection_category_whitelist, padding_factor, num_annotated_classes)
+    elif use_tf_data:
+        updated_json = classify_boxes_tf_data(classification_graph, updated_json, image_dir, confidence_threshold,
+                                              detection_category_whitelist, padding_factor, num_annotated_classes, batch_size,
+                                              enable_xla, enable_fp16=enable_fp16)
+    else:
+        updated_json = classify_boxes(classification_graph, updated_json, image_dir, confidence_threshold, detection_category_whitelist,
+                                      padding_factor, num_annotated_classes, batch_size, enable_xla, num_workers, enable_fp16)
     elapsed = time.time() - startTime
     print("Done running detector and classifier in {}".format(humanfriendly.format_timespan(elapsed)))
 
     # Write output json
-    with open(output_json_file, 'wt') as fi:
-        json.dump(updated_json, fi, indent=1)
+    write_output_json(updated_json, output_json_file)
 
     return detection_graph, classification_graph
 
@@ -270,7 +1264,8 @@ def main():
     parser = argparse.ArgumentParser(description='Applies a classifier to all detected boxes of the detection API output (JSON format).')
     parser.add_argument('classifier_file', type=str, help='Frozen graph for classification including pre-processing. The graphs ' + \
                         'will receive an image with values in [0,1], so double check that you use the correct model. The script ' + \
-                        '`export_inference_graph_serengeti.sh` shows how to create such a model',
+                        '`export_inference_graph_serengeti.sh` shows how to create such a model. A .tflite file produced by ' + \
+                        'convert_classifier_to_tflite (quantized, 2-4x faster) is also accepted',
                        metavar='classifier_file')
     parser.add_argument('classes_file', action='store', type=str, help='File with the class names. Each line should contain ' + \
                         'one name and the first line should correspond to the first output, the second line to the second model output, etc.')
@@ -285,13 +1280,27 @@ def main():
                         help='Number of top-scoring classes to add to the output for each bounding box, default: %d'%NUM_ANNOTATED_CLASSES)
     parser.add_argument('--detection_category_whitelist', type=str, nargs='+', default=DETECTION_CATEGORY_WHITELIST,
                         help='We will run the detector on all detections with these detection categories, default: ' + ' '.join(DETECTION_CATEGORY_WHITELIST))
+    parser.add_argument('--batch_size', action='store', type=int, default=DEFAULT_BATCH_SIZE,
+                        help='Number of crops to classify with a single sess.run call, default: %d'%DEFAULT_BATCH_SIZE)
+    parser.add_argument('--num_workers', action='store', type=int, default=0,
+                        help='Number of worker processes for image preprocessing; 0 (default) uses prefetch threads instead')
+    parser.add_argument('--enable_xla', action='store_true',
+                        help='Compile the classifier with XLA; speeds up long runs at the cost of slower startup')
+    parser.add_argument('--enable_fp16', action='store_true',
+                        help='Run the classifier in mixed fp16/fp32 precision; ~2x faster on GPUs with tensor cores, ' + \
+                        'no effect elsewhere')
+    parser.add_argument('--use_tf_data', action='store_true',
+                        help='Feed the classifier through a tf.data pipeline (faster, but requires all images to be ' + \
+                        'readable JPEG files; a single bad file aborts the run)')
     args = parser.parse_args()
 
 
     load_and_run_classifier(classifier_file=args.classifier_file, classes_file=args.classes_file, image_dir=args.image_dir,
                           detector_json_file=args.detector_json_file, output_json_file=args.output_json_file,
                           confidence_threshold=args.threshold, padding_factor=args.padding_factor,
-                          num_annotated_classes=args.num_annotated_classes, detection_category_whitelist=args.detection_category_whitelist)
+                          num_annotated_classes=args.num_annotated_classes, detection_category_whitelist=args.detection_category_whitelist,
+                          batch_size=args.batch_size, use_tf_data=args.use_tf_data, enable_xla=args.enable_xla,
+                          num_workers=args.num_workers, enable_fp16=args.enable_fp16)
 
 
 if __name__ == '__main__':
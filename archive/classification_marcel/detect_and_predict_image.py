@@ -99,7 +99,13 @@ def generate_detections(detection_graph,images):
             #
             # So if you find a bug related to using PIL, update this comment
             # to indicate what it was, but also disable .png support.
-            image = PIL.Image.open(image).convert("RGB"); image = np.array(image)
+            image = PIL.Image.open(image)
+            # Ask the decoder for RGB directly so convert() is a no-op for JPEGs,
+            # and use asarray, which doesn't copy the pixel buffer again
+            image.draft('RGB', None)
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            image = np.asarray(image)
             # image = mpimg.imread(image)
 
             # This shouldn't be necessarily when loading with PIL and converting to RGB
@@ -256,7 +262,9 @@ def classify_boxes(classification_graph, boxes, scores, classes, images, confide
                     if selection[iBox]:
                         crop_box = crop_boxes[selection_box_idx[iBox]]
                         cropped_img = image[crop_box[0]:crop_box[2], crop_box[1]:crop_box[3]]
-                        input_image = cropped_img.astype(float) / 255
+                        # Scale pixel values to [0,1], explicitly in float32: astype(float)
+                        # would promote the crop to float64
+                        input_image = cropped_img.astype(np.float32) * (1.0 / 255.0)
                         # Run inference
                         predictions = sess.run(predictions_tensor, feed_dict={image_tensor: input_image})
                         species_scores[iImage].append(predictions)